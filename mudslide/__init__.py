@@ -9,6 +9,7 @@ from .trajectory_sh import *
 from .cumulative_sh import *
 from .even_sampling import *
 from .ehrenfest import *
+from .batched_sh import *
 from .batch import *
 
 from . import models
@@ -5,6 +5,8 @@ from __future__ import print_function, division
 import queue
 import sys
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import numpy as np
 
@@ -12,7 +14,7 @@ from .exceptions import StillInteracting
 from .tracer import TraceManager
 from .constants import boltzmann
 
-from typing import Any, Iterator, Tuple
+from typing import Any, Iterator, Tuple, List, Dict
 from .typing import ModelT, TrajGenT, ArrayLike
 
 logger = logging.getLogger("mudslide")
@@ -140,7 +142,7 @@ class BatchedTraj(object):
          | initial_time       | 0.0                        |
          | samples            | 2000                       |
          | dt                 | 20.0  ~ 0.5 fs             |
-         | nprocs             | 1                          |
+         | nprocs             | 1 (>1 uses a process pool) |
          | outcome_type       | "state"                    |
          | seed               | None (date)                |
         """
@@ -177,19 +179,9 @@ class BatchedTraj(object):
         nsamples = int(self.options["samples"])
         nprocs = self.options["nprocs"]
 
-        if nprocs > 1:
-            logger.warning('nprocs {} specified, but parallelism is not currently handled'.format(nprocs))
-
-
         traj_queue: Any = queue.Queue()
         results_queue: Any = queue.Queue()
 
-        #traj_queue = mp.JoinableQueue()
-        #results_queue = mp.Queue()
-        #procs = [ mp.Process(target=traj_runner, args=(traj_queue, results_queue, )) for p in range(nprocs) ]
-        #for p in procs:
-        #    p.start()
-
         for x0, p0, initial, params in self.traj_gen(nsamples):
             traj_input = self.options
             traj_input.update(params)
@@ -197,14 +189,13 @@ class BatchedTraj(object):
                     queue=traj_queue, **traj_input)
             traj_queue.put(traj)
 
-        while not traj_queue.empty():
-            traj = traj_queue.get()
-            results = traj.simulate()
-            results_queue.put(results)
-
-        #traj_queue.join()
-        #for p in procs:
-        #    p.terminate()
+        if nprocs > 1:
+            run_pool(traj_queue, results_queue, nprocs)
+        else:
+            while not traj_queue.empty():
+                traj = traj_queue.get()
+                results = traj.simulate()
+                results_queue.put(results)
 
         while not results_queue.empty():
             r = results_queue.get()
@@ -213,6 +204,67 @@ class BatchedTraj(object):
         self.tracemanager.outcomes = self.tracemanager.outcome()
         return self.tracemanager
 
+def simulate_detached(traj: Any) -> Tuple[Any, List]:
+    """Run a trajectory in a worker process
+
+    The queue a trajectory holds cannot be sent between processes, so the trajectory
+    gets a local queue here and anything it spawns is handed back with the results.
+
+    :param traj: trajectory with a `simulate()` function
+    :return: (results of `simulate()`, list of spawned trajectories)
+    """
+    local_queue: Any = queue.Queue()
+    traj.queue = local_queue
+    results = traj.simulate()
+
+    spawned = []
+    while not local_queue.empty():
+        spawn = local_queue.get()
+        spawn.queue = None
+        spawned.append(spawn)
+    return results, spawned
+
+def run_pool(traj_queue: Any, results_queue: Any, nprocs: int) -> None:
+    """Compute trajectories from queue on a pool of worker processes
+
+    Trajectories spawned along the way are sent back to the pool until none are left.
+    Results are put on results_queue in the same order a serial run would produce them:
+    the queued trajectories first, then everything they spawned, breadth first.
+
+    :param traj_queue: queue containing trajectories with a `simulate()` function
+    :param results_queue: queue to store results of each call to `simulate()`
+    :param nprocs: number of worker processes
+    """
+    nroots = 0
+    results: Dict[int, Any] = {}
+    children: Dict[int, List[int]] = {}
+
+    with ProcessPoolExecutor(max_workers=nprocs) as executor:
+        pending = {}
+        while not traj_queue.empty():
+            traj = traj_queue.get()
+            traj.queue = None
+            pending[executor.submit(simulate_detached, traj)] = nroots
+            nroots += 1
+        njobs = nroots
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                results[job], spawned = future.result()
+                children[job] = list(range(njobs, njobs + len(spawned)))
+                for traj in spawned:
+                    pending[executor.submit(simulate_detached, traj)] = njobs
+                    njobs += 1
+
+    # walk the spawn tree breadth first, just like the FIFO queue of a serial run
+    order = deque(range(nroots))
+    while order:
+        job = order.popleft()
+        results_queue.put(results[job])
+        order.extend(children[job])
+
 def traj_runner(traj_queue: Any, results_queue: Any) -> None:
     """Runner for computing jobs from queue
 
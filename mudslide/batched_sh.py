@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Propagate a batch of independent FSSH trajectories in lockstep"""
+
+from __future__ import division
+
+import numpy as np
+
+from .tracer import TraceManager
+from .math import poisson_prob_scale, velocity_rescale
+
+from typing import List, Dict, Any, Optional, Tuple
+from .typing import ArrayLike
+
+
+class BatchedTrajectorySH(object):
+    """Class to propagate many independent FSSH trajectories at once
+
+    Positions, velocities, density matrices and active states are stored with a
+    leading trajectory axis so that the classical update, the electronic propagation
+    and the hopping probabilities each cost a single NumPy call per step for the
+    whole batch. The model is still evaluated one trajectory at a time, and each
+    trajectory draws from its own random generator, so a trajectory in the batch
+    follows the same path as a TrajectorySH started with the same seed_sequence.
+
+    Only the "exp" electronic integration is supported.
+    """
+
+    def __init__(self, model: Any, x0: ArrayLike, p0: ArrayLike, rho0: ArrayLike, tracemanager: Any = None, **options: Any):
+        """Constructor
+        :param model: Model object defining problem
+        :param x0: [ntraj, ndim] initial positions
+        :param p0: [ntraj, ndim] initial momenta
+        :param rho0: "ground", "first_excited", or [ntraj, nstates, nstates] initial density matrices
+        :param tracemanager: TraceManager used to collect results
+        :param options: option dictionary (see TrajectorySH)
+        """
+        self.electronic_dtype = np.dtype(options.get("electronic_dtype", np.complex128))
+        if self.electronic_dtype not in [ np.complex64, np.complex128 ]:
+            raise Exception("electronic_dtype accepts only complex64 or complex128")
+
+        self.model = model
+        self.tracemanager = tracemanager if tracemanager is not None else TraceManager()
+        self.mass = model.mass
+
+        nst, ndim = model.nstates(), model.ndim()
+        self.position = np.array(x0, dtype=np.float64).reshape(-1, ndim)
+        self.velocity = np.array(p0, dtype=np.float64).reshape(-1, ndim) / self.mass
+        ntraj = self.position.shape[0]
+        if self.velocity.shape[0] != ntraj:
+            raise Exception("x0 and p0 must describe the same number of trajectories")
+
+        if np.isscalar(rho0):
+            if rho0 == "ground":
+                state0 = 0
+            elif rho0 == "first_excited":
+                state0 = 1
+            else:
+                raise Exception("Unrecognized initial state option")
+            self.rho = np.zeros([ntraj, nst, nst], dtype=self.electronic_dtype)
+            self.rho[:, state0, state0] = 1.0
+            self.state = np.full(ntraj, state0, dtype=np.intp)
+        else:
+            try:
+                self.rho = np.array(np.broadcast_to(rho0, [ntraj, nst, nst]), dtype=self.electronic_dtype)
+                self.state = np.array(np.broadcast_to(options["state0"], [ntraj]), dtype=np.intp)
+            except:
+                raise Exception("Unrecognized initial state option")
+
+        bounds = options.get("bounds", None)
+        self.box_bounds: Optional[Tuple[np.ndarray, np.ndarray]]
+        if bounds:
+            self.box_bounds = (np.array(bounds[0], dtype=np.float64), np.array(bounds[1], dtype=np.float64))
+        else:
+            self.box_bounds = None
+        self.max_steps = options.get("max_steps", 100000) # < 0 interpreted as no limit
+        self.max_time = options.get("max_time", 1e25) # set to an outrageous number by default
+        self.found_box = np.zeros(ntraj, dtype=np.bool_)
+
+        self.time = float(options.get("t0", 0.0))
+        self.nsteps = int(options.get("previous_steps", 0))
+        self.trace_every = int(options.get("trace_every", 1))
+
+        self.dt = float(options["dt"])
+        self.outcome_type = options.get("outcome_type", "state")
+
+        # one generator per trajectory so results match the serial trajectories
+        ss = options.get("seed_sequence", None)
+        if isinstance(ss, (list, tuple)):
+            seeds = list(ss)
+        else:
+            ss = ss if isinstance(ss, np.random.SeedSequence) else np.random.SeedSequence(ss)
+            seeds = ss.spawn(ntraj)
+        if len(seeds) != ntraj:
+            raise Exception("Need one seed_sequence per trajectory")
+        self.random_states = [ np.random.default_rng(s) for s in seeds ]
+
+        if options.get("electronic_integration", "exp").lower() != "exp":
+            raise Exception("BatchedTrajectorySH only supports the \"exp\" electronic integration")
+
+        self.hopping_probability = options.get("hopping_probability", "tully")
+        if self.hopping_probability not in [ "tully", "poisson" ]:
+            raise Exception("hopping_probability accepts only \"tully\" or \"poisson\" options")
+
+        self.tracers = [ self.tracemanager.spawn_tracer() for i in range(ntraj) ]
+        self.electronics: List[Any] = [ None ] * ntraj
+        self.hopping = np.zeros(ntraj, dtype=np.float64)
+        self.zeta = np.zeros(ntraj, dtype=np.float64)
+        self.active = np.ones(ntraj, dtype=np.bool_)
+
+        # stacked electronic quantities for the current and previous steps
+        self.hamiltonian = np.zeros([ntraj, nst, nst], dtype=np.float64)
+        self.force = np.zeros([ntraj, nst, ndim], dtype=np.float64)
+        self.derivative_coupling = np.zeros([ntraj, nst, nst, ndim], dtype=np.float64)
+        self.last_hamiltonian = np.zeros_like(self.hamiltonian)
+        self.last_force = np.zeros_like(self.force)
+        self.last_derivative_coupling = np.zeros_like(self.derivative_coupling)
+
+    def currently_interacting(self, idx: np.ndarray) -> np.ndarray:
+        """Determines which trajectories are currently inside the interaction region
+
+        :param idx: indices of the trajectories to check
+        :return: boolean array
+        """
+        if self.box_bounds is None:
+            return np.zeros(len(idx), dtype=np.bool_)
+        pos = self.position[idx]
+        return np.all((self.box_bounds[0] < pos) & (pos < self.box_bounds[1]), axis=1)
+
+    def continue_simulating(self, idx: np.ndarray) -> np.ndarray:
+        """Decide which trajectories should keep running
+
+        :param idx: indices of the running trajectories
+        :return: boolean array, True for trajectories that should keep running
+        """
+        if self.max_steps >= 0 and self.nsteps >= self.max_steps:
+            return np.zeros(len(idx), dtype=np.bool_)
+        if self.time >= self.max_time or abs(self.time - self.max_time) <= 1e-8:
+            return np.zeros(len(idx), dtype=np.bool_)
+
+        inside = self.currently_interacting(idx)
+        found = self.found_box[idx]
+        self.found_box[idx] = found | inside
+        return np.where(found, inside, True)
+
+    def update_electronics(self, idx: np.ndarray) -> None:
+        """Compute electronics at the current positions and stack the results
+
+        :param idx: indices of the trajectories to update
+        """
+        self.last_hamiltonian, self.hamiltonian = self.hamiltonian, self.last_hamiltonian
+        self.last_force, self.force = self.force, self.last_force
+        self.last_derivative_coupling, self.derivative_coupling = self.derivative_coupling, self.last_derivative_coupling
+
+        for i in idx:
+            if self.electronics[i] is None:
+                elec = self.model.update(self.position[i].copy())
+            else:
+                elec = self.electronics[i].update(self.position[i].copy())
+            self.electronics[i] = elec
+            self.hamiltonian[i] = elec.hamiltonian
+            self.force[i] = elec.force
+            self.derivative_coupling[i] = elec.derivative_coupling
+
+    def kinetic_energy(self, idx: np.ndarray) -> np.ndarray:
+        """Kinetic energy
+
+        :param idx: indices of the trajectories
+        :return: [len(idx)] kinetic energies
+        """
+        v = self.velocity[idx]
+        return 0.5 * np.einsum("bm,bm->b", self.mass * v, v)
+
+    def potential_energy(self, idx: np.ndarray) -> np.ndarray:
+        """Potential energy of the active states
+
+        :param idx: indices of the trajectories
+        :return: [len(idx)] potential energies
+        """
+        s = self.state[idx]
+        return self.hamiltonian[idx, s, s]
+
+    def active_force(self, idx: np.ndarray, last: bool = False) -> np.ndarray:
+        """Force on the active states
+
+        :param idx: indices of the trajectories
+        :param last: use the electronics from the previous step
+        :return: [len(idx), ndim] forces
+        """
+        force = self.last_force if last else self.force
+        return force[idx, self.state[idx], :]
+
+    def advance_position(self, idx: np.ndarray) -> None:
+        """Move classical positions forward one step
+
+        :param idx: indices of the trajectories to move
+        """
+        acceleration = self.active_force(idx) / self.mass
+        self.position[idx] += self.velocity[idx] * self.dt + 0.5 * acceleration * self.dt * self.dt
+
+    def advance_velocity(self, idx: np.ndarray) -> None:
+        """Move classical velocities forward one step
+
+        :param idx: indices of the trajectories to move
+        """
+        last_acceleration = self.active_force(idx, last=True) / self.mass
+        this_acceleration = self.active_force(idx) / self.mass
+        self.velocity[idx] += 0.5 * (last_acceleration + this_acceleration) * self.dt
+
+    def hamiltonian_propagator(self, idx: np.ndarray) -> np.ndarray:
+        """Compute the Hamiltonians used to propagate the electronic wavefunctions
+
+        :param idx: indices of the trajectories
+        :return: [len(idx), nstates, nstates] H - i TV at the midpoint of the last step
+        """
+        # TrajectorySH.advance_velocity leaves last_velocity bound to velocity, so the serial
+        # propagator couples with the end of step velocity. Use the same one to stay on its path.
+        velo = self.velocity[idx]
+        H = 0.5 * (self.hamiltonian[idx] + self.last_hamiltonian[idx])
+        tau = self.derivative_coupling[idx] + self.last_derivative_coupling[idx]
+        TV = 0.5 * np.einsum("bijx,bx->bij", tau, velo)
+        return (H - 1j * TV).astype(self.electronic_dtype, copy=False)
+
+    def propagate_electronics(self, idx: np.ndarray, W: np.ndarray, dt: float) -> None:
+        """Propagates the density matrices from t to t+dt with a single batched eigh
+
+        :param idx: indices of the trajectories
+        :param W: [len(idx), nstates, nstates] propagators from hamiltonian_propagator
+        :param dt: time step
+        """
+        diags, coeff = np.linalg.eigh(W)
+        U = np.matmul(coeff * np.exp(-1j * diags * dt)[:, np.newaxis, :], np.conj(coeff).transpose(0, 2, 1))
+        self.rho[idx] = np.matmul(np.matmul(U, self.rho[idx]), np.conj(U).transpose(0, 2, 1))
+
+    def surface_hopping(self, idx: np.ndarray, W: np.ndarray) -> None:
+        """Compute probabilities of hopping, generate random numbers, and perform hops
+
+        :param idx: indices of the trajectories
+        :param W: [len(idx), nstates, nstates] propagators from hamiltonian_propagator
+        """
+        r = np.arange(len(idx))
+        s = self.state[idx]
+        rho = self.rho[idx]
+
+        gkndt = 2.0 * np.imag(rho[r, s, :] * W[r, :, s]) * self.dt / np.real(rho[r, s, s])[:, np.newaxis]
+        gkndt[r, s] = 0.0
+        np.maximum(gkndt, 0.0, out=gkndt)
+
+        if self.hopping_probability == "poisson":
+            gkndt *= np.array([ poisson_prob_scale(x) for x in np.sum(gkndt, axis=1) ])[:, np.newaxis]
+        self.hopping[idx] = np.sum(gkndt, axis=1)
+
+        zeta = np.array([ self.random_states[i].uniform() for i in idx ])
+        self.zeta[idx] = zeta
+
+        acc_prob = np.cumsum(gkndt, axis=1)
+        hopped = zeta < acc_prob[:, -1]
+        # first state whose accumulated probability exceeds zeta
+        targets = np.sum(acc_prob <= zeta[:, np.newaxis], axis=1)
+        for j in np.flatnonzero(hopped):
+            self.hop_to_it(idx[j], int(targets[j]), zeta[j], acc_prob[j, targets[j]])
+
+    def hop_to_it(self, i: int, hop_to: int, zeta: float, prob: float) -> None:
+        """
+        Hop trajectory i from its active state to the given state, including
+        rescaling the momentum
+
+        :param i: index of the trajectory
+        :param hop_to: target state
+        :param zeta: random number that triggered the hop
+        :param prob: accumulated probability at the target state
+        """
+        hop_from = int(self.state[i])
+        delV = self.hamiltonian[i, hop_to, hop_to] - self.hamiltonian[i, hop_from, hop_from]
+        direction = self.derivative_coupling[i, hop_from, hop_to, :]
+
+        dv = velocity_rescale(self.velocity[i], direction, self.mass, delV)
+        if dv is not None:
+            self.velocity[i] += dv
+            self.state[i] = hop_to
+            self.tracers[i].hop(self.time, hop_from, hop_to, zeta, prob)
+
+    def snapshot(self, i: int) -> Dict[str, Any]:
+        """Collect data for trajectory i for logging
+
+        :param i: index of the trajectory
+        :return: dictionary with all data from current time step
+        """
+        s = int(self.state[i])
+        potential = self.hamiltonian[i, s, s]
+        kinetic = 0.5 * float(np.dot(self.mass * self.velocity[i], self.velocity[i]))
+        return {
+            "time" : self.time,
+            "position"  : np.copy(self.position[i]),
+            "momentum"  : self.mass * self.velocity[i],
+            "potential" : potential,
+            "kinetic"   : kinetic,
+            "energy"    : potential + kinetic,
+            "density_matrix" : np.copy(self.rho[i]),
+            "active"    : s,
+            "electronics" : self.electronics[i],
+            "hopping"   : self.hopping[i],
+            "zeta"   : self.zeta[i]
+            }
+
+    def trace(self, idx: np.ndarray, force: bool = False) -> None:
+        """Add results from current time point to the tracer of each trajectory in idx
+        Only adds snapshots if nsteps%trace_every == 0, unless force=True
+
+        :param idx: indices of the trajectories
+        :param force: force snapshot
+        """
+        if force or (self.nsteps % self.trace_every) == 0:
+            for i in idx:
+                self.tracers[i].collect(self.snapshot(i))
+
+    def simulate(self) -> TraceManager:
+        """
+        Simulate all trajectories until each one finishes
+
+        :return: TraceManager holding one Trace per trajectory
+        """
+        idx = np.flatnonzero(self.active)
+        self.update_electronics(idx)
+        # start with the previous step equal to the current one
+        self.last_hamiltonian[:] = self.hamiltonian
+        self.last_force[:] = self.force
+        self.last_derivative_coupling[:] = self.derivative_coupling
+
+        self.trace(idx)
+
+        while idx.size > 0:
+            self.advance_position(idx)
+            self.update_electronics(idx)
+            self.advance_velocity(idx)
+
+            W = self.hamiltonian_propagator(idx)
+            self.propagate_electronics(idx, W, self.dt)
+            self.surface_hopping(idx, W)
+
+            self.time += self.dt
+            self.nsteps += 1
+
+            keep_going = self.continue_simulating(idx)
+            finished = idx[~keep_going]
+            self.trace(finished, force=True)
+            self.active[finished] = False
+
+            idx = idx[keep_going]
+            self.trace(idx)
+
+        for t in self.tracers:
+            self.tracemanager.merge_tracer(t)
+        self.tracemanager.outcomes = self.tracemanager.outcome()
+        return self.tracemanager
@@ -19,6 +19,9 @@ class TrajectoryCum(TrajectorySH):
     threshold. Swarmed results should be identical to the traditional variety, but
     should be a bit easier to reproduce since far fewer random numbers are ever needed.
     """
+
+    __slots__ = ( "prob_cum", )
+
     def __init__(self, *args: Any, **kwargs: Any):
         """Constructor (see TrajectorySH constructor)"""
         TrajectorySH.__init__(self, *args, **kwargs)
@@ -26,22 +29,20 @@ class TrajectoryCum(TrajectorySH):
         self.prob_cum = np.longdouble(0.0)
         self.zeta = self.random()
 
+    def random(self) -> np.float64:
+        """Get random number for hopping decisions
+
+        Cumulative hopping only draws when it hops, and those draws interleave with
+        random_state.choice(), so they are not buffered.
+
+        :return: uniform random number between 0 and 1
+        """
+        return self.random_state.uniform()
+
     def snapshot(self) -> Dict:
         """returns loggable data"""
-        out = {
-            "time" : self.time,
-            "position"  : np.copy(self.position),
-            "momentum"  : self.mass * np.copy(self.velocity),
-            "potential" : self.potential_energy(),
-            "kinetic"   : self.kinetic_energy(),
-            "energy"    : self.total_energy(),
-            "density_matrix" : np.copy(self.rho),
-            "active"    : self.state,
-            "electronics" : self.electronics,
-            "hopping"   : self.hopping,
-            "zeta"      : self.zeta,
-            "prob_cum"  : self.prob_cum
-            }
+        out = TrajectorySH.snapshot(self)
+        out["prob_cum"] = self.prob_cum
         return out
 
     def hopper(self, gkndt: ArrayLike) -> List[Dict]:
@@ -50,10 +51,10 @@ class TrajectoryCum(TrajectorySH):
         :param probs: [nstates] numpy array of individual hopping probabilities
         :returns: dictioanry with { "target": int, "weight": float, "zeta": float, "prob": float }
         """
-        self.hopping = np.sum(gkndt)
+        gkdt = float(gkndt.sum())
+        self.hopping = gkdt
 
         accumulated = np.longdouble(self.prob_cum)
-        gkdt = np.sum(gkndt)
         accumulated += (accumulated - 1.0) * np.expm1(-gkdt)
         if accumulated > self.zeta: # then hop
             # where to hop
@@ -10,6 +10,9 @@ from .typing import ArrayLike, DtypeLike, ElectronicT
 
 class Ehrenfest(TrajectorySH):
     """Ehrenfest dynamics"""
+
+    __slots__ = ()
+
     def __init__(self, *args: Any, **kwargs: Any):
         TrajectorySH.__init__(self, *args, **kwargs)
 
@@ -33,5 +36,4 @@ class Ehrenfest(TrajectorySH):
 
     def surface_hopping(self, last_electronics: ElectronicT, this_electronics: ElectronicT):
         """Ehrenfest never hops"""
-        return
 
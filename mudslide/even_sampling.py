@@ -15,6 +15,10 @@ from .typing import ArrayLike, ElectronicT
 
 class SpawnStack(object):
     """Data structure to inform how new traces are spawned and weighted"""
+
+    __slots__ = ( "sample_stack", "base_weight", "marginal_weight", "marginal_weights", "last_stack",
+            "last_dw", "izeta", "zeta_" )
+
     def __init__(self, sample_stack: List, weight: float = 1.0):
         self.sample_stack = sample_stack
         self.base_weight: float = weight
@@ -29,7 +33,7 @@ class SpawnStack(object):
             self.marginal_weights = mw
             self.last_dw = weights[0]
         else:
-            self.margin_weights = np.ones(1)
+            self.marginal_weights = np.ones(1)
             self.last_dw = 0.0
 
         self.izeta: int = 0
@@ -104,13 +108,15 @@ class SpawnStack(object):
         forest: List[Dict] = []
         spawn_size = [ mcsamples ] + [ 1 ] * (len(nsamples) - 1)
 
+        # the tree is only ever read after construction, so every node at a given
+        # depth shares the same list of children instead of holding its own copy
         for ns in reversed(nsamples):
-            leaves = cp.copy(forest)
+            leaves = forest
             samples, weights = quadrature(ns, 0.0, 1.0, method=method)
             spawnsize = spawn_size.pop(0)
             forest = [ { "zeta" : s,
                 "dw" : dw,
-                "children" : cp.deepcopy(leaves),
+                "children" : leaves,
                 "spawn_size" : spawnsize }
                     for s, dw in zip(samples, weights) ] # type: ignore
 
@@ -124,6 +130,9 @@ class EvenSamplingTrajectory(TrajectoryCum):
     of the cumulative probability distribution. This is an *experimental*
     in principle deterministic algorithm for FSSH simulations.
     """
+
+    __slots__ = ( "spawn_stack", )
+
     def __init__(self, *args: Any, **options: Any):
         """Constructor (see TrajectoryCum constructor)"""
         TrajectoryCum.__init__(self, *args, **options)
@@ -166,6 +175,48 @@ class EvenSamplingTrajectory(TrajectoryCum):
                 spawn_stack = spawn_stack)
         return out
 
+    def _fast_clone(self, spawn_stack: Any) -> 'EvenSamplingTrajectory':
+        """Cheap version of clone() used when spawning
+
+        Like clone(spawn_stack), but only copies the state that diverges between spawns.
+        The model, queue, duration and current electronics are shared with the parent,
+        and spawn_stack is taken as is because spawn() always hands back a fresh
+        SpawnStack whose sample tree is read-only. Options that clone() does not forward,
+        e.g. electronic_integration, electronic_dtype and hopping_probability, keep the
+        parent's values here instead of reverting to their defaults.
+
+        :param spawn_stack: SpawnStack for the new trajectory
+        :return: new trajectory set to restart at the next step
+        """
+        out = object.__new__(self.__class__)
+        for k, v in self._attributes():
+            setattr(out, k, v)
+
+        out.position = self.position.copy()
+        out.velocity = self.velocity.copy()
+        out.last_velocity = self.last_velocity.copy()
+        if hasattr(self, "last_position"):
+            out.last_position = self.last_position.copy()
+        out.rho = self.rho.copy()
+        out.tracer = cp.deepcopy(self.tracer)
+        out._alloc_scratch()
+
+        out.time = self.time + self.dt # will restart at the next step
+        out.nsteps = self.nsteps + 1 # will restart at the next step
+        out.restart = True
+        out.force_quit = False
+        out.weight = 1.0
+        out.hopping = 0.0
+        out.prob_cum = np.longdouble(0.0)
+
+        # draw random numbers exactly as the constructor would
+        out.seed_sequence = self.seed_sequence.spawn(1)[0]
+        out.random_state = np.random.default_rng(out.seed_sequence)
+        out.zeta = out.random()
+        out.spawn_stack = spawn_stack
+        out.zeta = out.spawn_stack.next_zeta(0.0, out.random_state)
+        return out
+
     def hopper(self, probs: ArrayLike) -> List[Dict[str, Union[int, float]]]:
         """Given a set of probabilities, determines whether and where to hop
         :param probs: [nstates] numpy array of individual hopping probabilities
@@ -173,7 +224,7 @@ class EvenSamplingTrajectory(TrajectoryCum):
         """
         accumulated = self.prob_cum
         probs[self.state] = 0.0 # ensure self-hopping is nonsense
-        gkdt = np.sum(probs)
+        gkdt = float(probs.sum())
 
         accumulated = 1 - (1 - accumulated) * np.exp(-gkdt)
         if accumulated > self.zeta: # then hop
@@ -219,7 +270,7 @@ class EvenSamplingTrajectory(TrajectoryCum):
         if self.spawn_stack.do_spawn():
             for hop in hop_to:
                 stack = hop["stack"]
-                spawn = self.clone(stack)
+                spawn = self._fast_clone(stack)
 
                 # trigger hop
                 TrajectoryCum.hop_to_it(spawn, [ hop ], electronics=spawn.electronics)
@@ -3,11 +3,78 @@
 
 from __future__ import division
 
+from math import copysign, sqrt
+
 import numpy as np
 
+from typing import Optional, Tuple, Union
+
 def poisson_prob_scale(x):
     """Computes (1 - exp(-x))/x which is needed when scaling Poisson probabilities"""
     if abs(x) < 1e-3:
         return 1 - x/2 + x**2/6 - x**3/24
     else:
         return -np.expm1(-x)/x
+
+def quadratic_small_root(a: float, b: float, c: float) -> float:
+    """Smaller magnitude root of a x^2 + b x + c = 0, assuming the roots are real
+
+    Uses the form q = -(b + sign(b) sqrt(b^2 - 4ac))/2 with roots q/a and c/q, which
+    avoids catastrophic cancellation.
+    """
+    q = -0.5 * (b + copysign(sqrt(b*b - 4.0*a*c), b))
+    if q == 0.0:
+        return 0.0
+    r1, r2 = q/a, c/q
+    return r1 if abs(r1) < abs(r2) else r2
+
+def velocity_rescale(velocity: np.ndarray, direction: np.ndarray, mass: Union[float, np.ndarray],
+        delV: float) -> Optional[np.ndarray]:
+    """Change in velocity along direction that takes up a change in potential energy
+
+    The new velocity is v + x M^-1 u, with u the normalized direction and x the smaller
+    root of a x^2 + b x + c = 0, so that the kinetic energy changes by -delV.
+
+    :param velocity: [ndim] current velocity
+    :param direction: [ndim] direction along which to rescale
+    :param mass: mass, scalar or [ndim]
+    :param delV: change in potential energy
+    :return: [ndim] change in velocity, or None if there is not enough kinetic energy along direction
+    """
+    u = direction / np.linalg.norm(direction)
+    M_inv = 1.0 / mass
+    a = float(np.dot(M_inv * u, u))
+    b = 2.0 * float(np.dot(velocity, u))
+    c = 2.0 * float(delV)
+    # no real root means there is not enough kinetic energy along u
+    if b*b - 4.0*a*c <= 0.0:
+        return None
+    return quadratic_small_root(a, b, c) * M_inv * u
+
+def eigh2(H: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Closed form eigendecomposition of a 2x2 Hermitian matrix
+
+    Drop-in replacement for np.linalg.eigh that avoids the LAPACK call overhead.
+
+    :param H: [2, 2] Hermitian matrix
+    :return: (eigenvalues in ascending order, [2, 2] complex eigenvectors stored as columns)
+    """
+    # plain python scalars are much cheaper than numpy scalars here
+    (a, b), (_, d) = H.tolist()
+    a, d, b = a.real, d.real, complex(b)
+    disc = ((a - d)**2 + 4.0 * (b.real**2 + b.imag**2))**0.5
+    l1, l2 = 0.5 * (a + d - disc), 0.5 * (a + d + disc)
+
+    # pick the form of the lower eigenvector that avoids cancellation
+    if a <= d:
+        x, y = complex(l1 - d), b.conjugate()
+    else:
+        x, y = b, complex(l1 - a)
+    norm = (abs(x)**2 + abs(y)**2)**0.5
+    if norm == 0.0: # H is proportional to the identity
+        x, y, norm = 1.0+0.0j, 0.0j, 1.0
+    x, y = x / norm, y / norm
+
+    dtype = np.promote_types(H.dtype, np.complex64)
+    coeff = np.array([ [ x, -y.conjugate() ], [ y, x.conjugate() ] ], dtype=dtype)
+    return np.array([l1, l2], dtype=np.finfo(dtype).dtype), coeff
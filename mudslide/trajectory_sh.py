@@ -8,15 +8,68 @@ import numpy as np
 
 from .propagation import rk4
 from .tracer import Trace
-from .math import poisson_prob_scale
+from .math import poisson_prob_scale, eigh2, velocity_rescale
 
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, Callable, Tuple, Iterator
 from .typing import ElectronicT, ArrayLike, DtypeLike
 
 
+def _exp_propagator(W: ArrayLike, dt: DtypeLike, eigh: Callable = np.linalg.eigh) -> ArrayLike:
+    """Time evolution operator U = exp(-i W dt) for a static Hermitian W
+
+    :param W: [nstates, nstates] Hermitian propagator, H - i TV
+    :param dt: time step
+    :param eigh: function used for the Hermitian eigendecomposition
+    :return: [nstates, nstates] unitary U
+    """
+    diags, coeff = eigh(W)
+    return np.dot(coeff * np.exp(-1j * diags * dt), coeff.T.conj())
+
+def _propagate_rho(U: ArrayLike, rho: ArrayLike, scratch: ArrayLike) -> None:
+    """Propagate density matrix in place, rho <- U rho U^dagger
+
+    :param U: [nstates, nstates] time evolution operator
+    :param rho: [nstates, nstates] density matrix, overwritten with the result
+    :param scratch: [nstates, nstates] complex temporary storage
+    """
+    np.dot(U, np.dot(rho, U.T.conj(), out=scratch), out=rho)
+
+def _pick_hop(probs: ArrayLike, zeta: float) -> Tuple[int, float]:
+    """Find the first state whose accumulated hopping probability exceeds zeta
+
+    :param probs: [nstates] individual hopping probabilities
+    :param zeta: uniform random number
+    :return: (target state or -1 if there is no hop, accumulated probability at the target)
+    """
+    if probs.shape[0] >= 8:
+        acc_prob = np.cumsum(probs)
+        hop_to = int(np.searchsorted(acc_prob, zeta, side="right"))
+        if hop_to < acc_prob.shape[0]:
+            return hop_to, acc_prob[hop_to]
+        return -1, acc_prob[-1]
+
+    # few states: a running sum that stops early beats the cumsum allocation
+    running = 0.0
+    for i, p in enumerate(probs.tolist()):
+        running += p
+        if running > zeta:
+            return i, running
+    return -1, running
+
+
 class TrajectorySH(object):
     """Class to propagate a single FSSH trajectory"""
 
+    __slots__ = ( "model", "tracer", "queue", "mass", "position", "last_position", "velocity", "last_velocity",
+            "rho", "state", "duration", "time", "nsteps", "trace_every", "dt", "outcome_type",
+            "seed_sequence", "random_state", "electronics", "hopping", "electronic_dtype",
+            "electronic_integration", "max_electronic_dt", "starting_electronic_intervals",
+            "weight", "restart", "force_quit", "hopping_probability", "zeta",
+            "_W_scratch", "_NAC_scratch", "_tau_scratch", "_gkndt_scratch", "_eigh",
+            "_zeta_buf", "_zeta_idx" )
+
+    random_block_size: int = 4096 # number of uniform random numbers drawn at once by random()
+
     def __init__(self, model: Any, x0: ArrayLike, p0: ArrayLike, rho0: ArrayLike, tracer: Any = None, queue: Any = None, **options: Any):
         """Constructor
         :param model: Model object defining problem
@@ -27,6 +80,11 @@ class TrajectorySH(object):
         :param queue: Trajectory queue
         :param options: option dictionary
         """
+        # complex64 halves the memory traffic of the electronic propagation at the cost of precision
+        self.electronic_dtype = np.dtype(options.get("electronic_dtype", np.complex128))
+        if self.electronic_dtype not in [ np.complex64, np.complex128 ]:
+            raise Exception("electronic_dtype accepts only complex64 or complex128")
+
         self.model = model
         self.tracer = tracer if tracer is not None else Trace()
         self.queue: Any = queue
@@ -38,18 +96,18 @@ class TrajectorySH(object):
             self.last_velocity[:] = options["last_velocity"]
         if np.isscalar(rho0):
             if rho0 == "ground":
-                self.rho = np.zeros([model.nstates(),model.nstates()], dtype=np.complex128)
+                self.rho = np.zeros([model.nstates(),model.nstates()], dtype=self.electronic_dtype)
                 self.rho[0,0] = 1.0
                 self.state = 0
             elif rho0 == "first_excited":
-                self.rho = np.zeros([model.nstates(),model.nstates()], dtype=np.complex128)
+                self.rho = np.zeros([model.nstates(),model.nstates()], dtype=self.electronic_dtype)
                 self.rho[1,1] = 1.0
                 self.state = 1
             else:
                 Exception("Unrecognized initial state option")
         else:
             try:
-                self.rho = np.copy(rho0)
+                self.rho = np.array(rho0, dtype=self.electronic_dtype)
                 self.state = int(options["state0"])
             except:
                 raise Exception("Unrecognized initial state option")
@@ -57,7 +115,12 @@ class TrajectorySH(object):
         # function duration_initialize should get us ready to for future continue_simulating calls
         # that decide whether the simulation has finished
         if "duration" in options:
-            self.duration = options["duration"]
+            # currently_interacting expects one bound per coordinate, so expand scalar bounds.
+            # A new dict keeps the caller's options untouched, since they may be reused.
+            bounds = options["duration"].get("box_bounds", None)
+            if bounds is not None:
+                bounds = tuple(np.broadcast_to(np.asarray(b, dtype=np.float64), self.position.shape) for b in bounds)
+            self.duration = dict(options["duration"], box_bounds=bounds)
         else:
             self.duration_initialize(options)
 
@@ -73,10 +136,17 @@ class TrajectorySH(object):
         ss = options.get("seed_sequence", None)
         self.seed_sequence = ss if isinstance(ss, np.random.SeedSequence) else np.random.SeedSequence(ss)
         self.random_state = np.random.default_rng(self.seed_sequence)
+        self._zeta_buf = np.zeros(0, dtype=np.float64) # filled on first call to random()
+        self._zeta_idx = 0
 
         self.electronics = options.get("electronics", None)
         self.hopping = 0.0
 
+        self._alloc_scratch()
+
+        # two state models skip LAPACK for the eigendecomposition in the exp propagator
+        self._eigh = eigh2 if model.nstates() == 2 else np.linalg.eigh
+
         self.electronic_integration = options.get("electronic_integration", "exp").lower()
         self.max_electronic_dt = options.get("max_electronic_dt", 0.1)
         self.starting_electronic_intervals = options.get("starting_electronic_intervals", 4)
@@ -100,15 +170,33 @@ class TrajectorySH(object):
         if self.weight == 0.0:
             self.force_quit = True
 
+    def _alloc_scratch(self) -> None:
+        """Allocate the scratch space reused by hamiltonian_propagator and surface_hopping every step"""
+        nst, ndim = self.model.nstates(), self.model.ndim()
+        real_dtype = np.finfo(self.electronic_dtype).dtype
+        self._W_scratch = np.empty([nst, nst], dtype=self.electronic_dtype)
+        self._NAC_scratch = np.empty([nst, nst], dtype=real_dtype)
+        self._tau_scratch = np.empty([nst, nst, ndim], dtype=real_dtype)
+        self._gkndt_scratch = np.empty(nst, dtype=np.float64)
+
+    def _attributes(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over (name, value) of every attribute that has been set, including slots"""
+        for cls in type(self).__mro__:
+            for k in getattr(cls, "__slots__", ()):
+                if hasattr(self, k):
+                    yield k, getattr(self, k)
+        if hasattr(self, "__dict__"): # subclasses without __slots__
+            yield from self.__dict__.items()
+
     def __deepcopy__(self, memo: Any) -> 'TrajectorySH':
         """Override deepcopy"""
         cls = self.__class__
         result = cls.__new__(cls)
         memo[id(self)] = result
         shallow_only = [ "queue" ]
-        for k, v in self.__dict__.items():
+        for k, v in self._attributes():
             setattr(result, k,
-                cp.deepcopy(v, memo) if v not in shallow_only else cp.copy(v))
+                cp.deepcopy(v, memo) if k not in shallow_only else v)
         return result
 
     def clone(self) -> 'TrajectorySH':
@@ -121,18 +209,34 @@ class TrajectorySH(object):
     def random(self) -> np.float64:
         """Get random number for hopping decisions
 
+        Numbers are drawn from random_state in blocks of random_block_size, which
+        yields exactly the same sequence as drawing them one at a time.
+
         :return: uniform random number between 0 and 1
         """
-        return self.random_state.uniform()
+        if self._zeta_idx >= self._zeta_buf.shape[0]:
+            self._zeta_buf = self.random_state.uniform(size=self.random_block_size)
+            self._zeta_idx = 0
+        zeta = self._zeta_buf[self._zeta_idx]
+        self._zeta_idx += 1
+        return zeta
 
     def currently_interacting(self) -> bool:
         """Determines whether trajectory is currently inside an interaction region
 
         :return: boolean
         """
-        if self.duration["box_bounds"] is None:
+        bounds = self.duration["box_bounds"]
+        if bounds is None:
             return False
-        return np.all(self.duration["box_bounds"][0] < self.position) and np.all(self.position < self.duration["box_bounds"][1])
+        lo, hi = bounds
+        if self.position.shape[0] > 16:
+            return bool(np.all((lo < self.position) & (self.position < hi)))
+        # for the usual handful of dimensions, a python loop beats numpy's dispatch overhead
+        for l, x, h in zip(lo.tolist(), self.position.tolist(), hi.tolist()):
+            if not (l < x < h):
+                return False
+        return True
 
     def duration_initialize(self, options: Dict[str, Any]) -> None:
         """Initializes variables related to continue_simulating
@@ -145,8 +249,8 @@ class TrajectorySH(object):
 
         bounds = options.get('bounds', None)
         if bounds:
-            duration["box_bounds"] = ( np.array(bounds[0], dtype=np.float64),
-                    np.array(bounds[1], dtype=np.float64) )
+            duration["box_bounds"] = ( np.full(self.position.shape, bounds[0], dtype=np.float64),
+                    np.full(self.position.shape, bounds[1], dtype=np.float64) )
         else:
             duration["box_bounds"] = None
         duration["max_steps"] = options.get('max_steps', 100000) # < 0 interpreted as no limit
@@ -163,7 +267,7 @@ class TrajectorySH(object):
             return False
         elif self.duration["max_steps"] >= 0 and self.nsteps >= self.duration["max_steps"]:
             return False
-        elif self.time >= self.duration["max_time"] or np.isclose(self.time, self.duration["max_time"], atol=1e-8, rtol=0.0):
+        elif self.time >= self.duration["max_time"] or abs(self.time - self.duration["max_time"]) <= 1e-8:
             return False
         elif self.duration["found_box"]:
             return self.currently_interacting()
@@ -187,13 +291,17 @@ class TrajectorySH(object):
 
         :return: dictionary with all data from current time step
         """
+        # position and rho are updated in place, so they must be copied, but
+        # the momentum is already a new array
+        potential = self.potential_energy()
+        kinetic = self.kinetic_energy()
         out = {
             "time" : self.time,
             "position"  : np.copy(self.position),
-            "momentum"  : self.mass * np.copy(self.velocity),
-            "potential" : self.potential_energy(),
-            "kinetic"   : self.kinetic_energy(),
-            "energy"    : self.total_energy(),
+            "momentum"  : self.mass * self.velocity,
+            "potential" : potential,
+            "kinetic"   : kinetic,
+            "energy"    : potential + kinetic,
             "density_matrix" : np.copy(self.rho),
             "active"    : self.state,
             "electronics" : self.electronics,
@@ -207,12 +315,13 @@ class TrajectorySH(object):
         with open("snapout.dat", "a") as file:
             file.write("{}\t{}\t{}\t{}\t{}\n".format(log["time"], log["potential"], log["kinetic"], log["energy"], log["active"]))
 
-    def kinetic_energy(self) -> np.float64:
+    def kinetic_energy(self) -> float:
         """Kinetic energy
 
         :return: kinetic energy
         """
-        return 0.5 * np.einsum('m,m,m', self.mass, self.velocity, self.velocity)
+        v = self.velocity
+        return 0.5 * float(np.dot(self.mass * v, v))
 
     def potential_energy(self, electronics: ElectronicT = None) -> DtypeLike:
         """Potential energy
@@ -247,21 +356,22 @@ class TrajectorySH(object):
             electronics = self.electronics
         return electronics.force[self.state,:]
 
-    def NAC_matrix(self, electronics: ElectronicT = None, velocity: ArrayLike = None) -> ArrayLike:
+    def NAC_matrix(self, electronics: ElectronicT = None, velocity: ArrayLike = None, out: ArrayLike = None) -> ArrayLike:
         """
         Nonadiabatic coupling matrix
 
         :param electronics: ElectronicStates from current step
         :param velocity: velocity used to compute NAC (defaults to self.velocity)
+        :param out: optional [nstates, nstates] array to store the result in
 
         :return: [nstates, nstates] NAC matrix
         """
         velo = velocity if velocity is not None else self.velocity
         if electronics is None:
             electronics = self.electronics
-        return np.einsum("ijx,x->ij", electronics.derivative_coupling, velo)
+        return np.einsum("ijx,x->ij", electronics.derivative_coupling, velo, out=out)
 
-    def mode_kinetic_energy(self, direction: ArrayLike) -> np.float64:
+    def mode_kinetic_energy(self, direction: ArrayLike) -> float:
         """
         Kinetic energy along given momentum mode
 
@@ -270,11 +380,10 @@ class TrajectorySH(object):
         :return: kinetic energy along specified direction
         """
         u = direction / np.linalg.norm(direction)
-        momentum = self.velocity * self.mass
-        component = np.dot(u, momentum) * u
-        return 0.5 * np.einsum('m,m,m', 1.0/self.mass, component, component)
+        pdotu = float(np.dot(u, self.velocity * self.mass))
+        return 0.5 * pdotu * pdotu * float(np.dot(u, u / self.mass))
 
-    def hop_allowed(self, direction: ArrayLike, dE: float):
+    def hop_allowed(self, direction: np.ndarray, dE: float) -> bool:
         """
         Returns whether a hop with the given rescale direction and requested energy change
         is allowed
@@ -286,11 +395,7 @@ class TrajectorySH(object):
         """
         if dE > 0.0:
             return True
-        u = direction / np.linalg.norm(direction)
-        a = np.einsum('m,m,m', np.reciprocal(self.mass), u, u)
-        b = 2.0 * np.dot(self.velocity, u)
-        c = -2.0 * dE
-        return (b*b > 4.0 * a * c)
+        return velocity_rescale(self.velocity, direction, self.mass, -dE) is not None
 
     def direction_of_rescale(self, source: int, target: int, electronics: ElectronicT=None) -> np.ndarray:
         """
@@ -305,36 +410,58 @@ class TrajectorySH(object):
         out = elec_states.derivative_coupling[source, target, :]
         return np.copy(out)
 
-    def rescale_component(self, direction: ArrayLike, reduction: DtypeLike) -> None:
+    def rescale_component(self, direction: np.ndarray, reduction: float) -> None:
         """
         Rescales velocity in the specified direction and amount
 
         :param direction: the direction of the velocity to rescale
         :param reduction: how much kinetic energy should be damped
         """
-        # normalize
-        u = direction / np.linalg.norm(direction)
-        M_inv = 1.0 / self.mass
-        a = np.einsum('m,m,m', M_inv, u, u)
-        b = 2.0 * np.dot(self.velocity, u)
-        c = -2.0 * reduction
-        roots = np.roots([a, b, c])
-        scal = min(roots, key=lambda x: abs(x))
-        self.velocity += scal * M_inv * u
+        dv = velocity_rescale(self.velocity, direction, self.mass, -reduction)
+        if dv is None:
+            raise Exception("Not enough kinetic energy along direction to rescale")
+        self.velocity += dv
 
     def hamiltonian_propagator(self, last_electronics: ElectronicT, this_electronics: ElectronicT, velo: ArrayLike = None) -> np.ndarray:
         """Compute the Hamiltonian used to propagate the electronic wavefunction
 
+        The result is written into scratch space owned by the trajectory, so it is
+        overwritten by the next call.
+
         :param elec_states: ElectronicStates at current time step
         :return: nonadiabatic coupling H - i W at midpoint between current and previous time steps
         """
         if velo is None:
             velo = 0.5 * (self.velocity + self.last_velocity)
 
-        H = 0.5 * (this_electronics.hamiltonian + last_electronics.hamiltonian) # type: ignore
-        TV = 0.5 * np.einsum("ijx,x->ij", this_electronics.derivative_coupling + last_electronics.derivative_coupling, #type: ignore
-                velo)
-        return H -1j * TV
+        W = self._W_scratch
+        np.add(this_electronics.hamiltonian, last_electronics.hamiltonian, out=W) # type: ignore
+        W *= 0.5
+
+        tau = np.add(this_electronics.derivative_coupling, last_electronics.derivative_coupling, # type: ignore
+                out=self._tau_scratch)
+        TV = np.einsum("ijx,x->ij", tau, velo, out=self._NAC_scratch, casting="same_kind")
+        TV *= 0.5
+
+        W.imag -= TV
+        return W
+
+    def hamiltonian_propagator_column(self, last_electronics: ElectronicT, this_electronics: ElectronicT, state: int,
+            velo: ArrayLike = None) -> np.ndarray:
+        """Single column of hamiltonian_propagator, contracting only the couplings into state
+
+        :param last_electronics: ElectronicStates at previous time step
+        :param this_electronics: ElectronicStates at current time step
+        :param state: column to compute
+        :return: [nstates] column of H - i W at midpoint between current and previous time steps
+        """
+        if velo is None:
+            velo = 0.5 * (self.velocity + self.last_velocity)
+
+        H = 0.5 * (this_electronics.hamiltonian[:,state] + last_electronics.hamiltonian[:,state]) # type: ignore
+        TV = 0.5 * (np.dot(this_electronics.derivative_coupling[:,state,:], velo) # type: ignore
+                + np.dot(last_electronics.derivative_coupling[:,state,:], velo)) # type: ignore
+        return H - 1j * TV
 
     def propagate_electronics(self, last_electronics: ElectronicT, this_electronics: ElectronicT, dt: DtypeLike) -> None:
         """Propagates density matrix from t to t+dt
@@ -348,11 +475,10 @@ class TrajectorySH(object):
         if self.electronic_integration == "exp":
             # Use midpoint propagator
             W = self.hamiltonian_propagator(last_electronics, this_electronics)
-            diags, coeff = np.linalg.eigh(W)
+            U = _exp_propagator(W, dt, self._eigh)
 
-            # use W as temporary storage
-            U = np.linalg.multi_dot([ coeff, np.diag(np.exp(-1j * diags * dt)), coeff.T.conj() ])
-            np.dot(U, np.dot(self.rho, U.T.conj(), out=W), out=self.rho)
+            # W scratch space doubles as temporary storage
+            _propagate_rho(U, self.rho, self._W_scratch)
         elif self.electronic_integration == "linear-rk4":
             last_H = last_electronics.hamiltonian
             this_H = this_electronics.hamiltonian
@@ -399,7 +525,7 @@ class TrajectorySH(object):
             tmprho = rk4(rho0, ydot, 0.0, dt, nsteps)
             ergs = np.exp(1j * eigs * dt).reshape([1, -1])
             phases = np.dot(ergs.T.conj(), ergs)
-            self.rho = np.linalg.multi_dot([vecs, tmprho * phases, vecs.T])
+            self.rho[:] = np.linalg.multi_dot([vecs, tmprho * phases, vecs.T])
         else:
             raise Exception("Unrecognized electronic integration option")
 
@@ -429,18 +555,22 @@ class TrajectorySH(object):
     def surface_hopping(self, last_electronics: ElectronicT, this_electronics: ElectronicT):
         """Compute probability of hopping, generate random number, and perform hops
 
-        :param elec_states: ElectronicStates from current step
-        :return: total probability of any hop occuring
-        """
-        H = self.hamiltonian_propagator(last_electronics, this_electronics)
+        The total probability of any hop occuring is stored in self.hopping.
 
-        gkndt = 2.0 * np.imag(self.rho[self.state,:] * H[:,self.state]) * self.dt / np.real(self.rho[self.state,self.state])
+        :param last_electronics: ElectronicStates from previous step
+        :param this_electronics: ElectronicStates from current step
+        """
+        # only the active column of the propagator enters the hopping probabilities
+        col = self.hamiltonian_propagator_column(last_electronics, this_electronics, self.state)
+        np.multiply(self.rho[self.state,:], col, out=col)
+        gkndt = np.multiply(col.imag, 2.0 * self.dt / np.real(self.rho[self.state,self.state]),
+                out=self._gkndt_scratch)
 
         # zero out 'self-hop' for good measure (numerical safety)
         gkndt[self.state] = 0.0
 
         # clip probabilities to make sure they are between zero and one
-        gkndt = np.maximum(gkndt, 0.0)
+        np.maximum(gkndt, 0.0, out=gkndt)
 
         hop_targets = self.hopper(gkndt)
         if hop_targets:
@@ -458,22 +588,15 @@ class TrajectorySH(object):
         if self.hopping_probability == "tully":
             probs = gkndt
         elif self.hopping_probability == "poisson":
-            probs = gkndt * poisson_prob_scale(np.sum(gkndt))
+            probs = gkndt * poisson_prob_scale(gkndt.sum())
         else:
             raise Exception("Unrecognized option for hopping_probability")
-        self.hopping = np.sum(probs) # store total hopping probability
+        self.hopping = float(probs.sum()) # store total hopping probability
 
         self.zeta = self.random()
-        acc_prob = np.cumsum(probs)
-        hops = np.less(self.zeta, acc_prob)
-        if any(hops):
-            hop_to = -1
-            for i in range(self.model.nstates()):
-                if hops[i]:
-                    hop_to = i
-                    break
-
-            return [{ "target" : hop_to, "weight" : 1.0, "zeta" : self.zeta, "prob" : hops[i] }]
+        hop_to, acc_prob = _pick_hop(probs, self.zeta)
+        if hop_to >= 0:
+            return [{ "target" : hop_to, "weight" : 1.0, "zeta" : self.zeta, "prob" : acc_prob }]
         else:
             return []
 
@@ -491,11 +614,13 @@ class TrajectorySH(object):
         new_potential, old_potential = elec_states.hamiltonian[hop_to, hop_to], elec_states.hamiltonian[self.state, self.state]
         delV = new_potential - old_potential
         rescale_vector = self.direction_of_rescale(self.state, hop_to)
-        component_kinetic = self.mode_kinetic_energy(rescale_vector)
-        if self.hop_allowed(rescale_vector, -delV):
+
+        # one pass both tests whether the hop is allowed and finds the rescaled velocity
+        dv = velocity_rescale(self.velocity, rescale_vector, self.mass, delV)
+        if dv is not None:
             hop_from = self.state
             self.state = hop_to
-            self.rescale_component(rescale_vector, -delV)
+            self.velocity += dv
             self.tracer.hop(self.time, hop_from, hop_to, hop_dict["zeta"], hop_dict["prob"])
 
     def simulate(self) -> 'Trace':
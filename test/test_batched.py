@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit testing for batched trajectories"""
+
+import unittest
+
+import mudslide
+import numpy as np
+
+class TestBatchedSH(unittest.TestCase):
+    """Test Suite for BatchedTrajectorySH"""
+    def setUp(self):
+        self.model = mudslide.models.TullySimpleAvoidedCrossing()
+        self.ntraj = 4
+        self.seeds = np.random.SeedSequence(5).spawn(self.ntraj)
+        self.k = np.linspace(8.0, 30.0, self.ntraj)
+        self.options = { "dt" : 5, "bounds" : [-5, 5] }
+
+    def test_matches_serial(self):
+        """Batched trajectories follow the same paths as serial ones"""
+        batch = mudslide.BatchedTrajectorySH(self.model, np.full([self.ntraj, 1], -10.0), self.k.reshape(-1, 1),
+                "ground", seed_sequence=self.seeds, **self.options).simulate()
+        self.assertEqual(len(batch.traces), self.ntraj)
+
+        for i in range(self.ntraj):
+            with self.subTest(i=i):
+                serial = mudslide.TrajectorySH(self.model, [-10.0], [self.k[i]], "ground",
+                        seed_sequence=self.seeds[i], **self.options).simulate()
+                batched = batch.traces[i]
+
+                self.assertEqual(len(serial), len(batched))
+                self.assertEqual([ (h["time"], h["from"], h["to"]) for h in serial.hops ],
+                                 [ (h["time"], h["from"], h["to"]) for h in batched.hops ])
+                self.assertEqual(serial[-1]["active"], batched[-1]["active"])
+                self.assertTrue(np.allclose(serial[-1]["position"], batched[-1]["position"], atol=1e-8))
+                self.assertTrue(np.allclose(serial[-1]["density_matrix"], batched[-1]["density_matrix"], atol=1e-8))
+
+class TestBatchedTrajPool(unittest.TestCase):
+    """Test Suite for running BatchedTraj on a process pool"""
+    def test_pool_matches_serial(self):
+        """Spawning trajectories give the same outcomes on a pool as in serial"""
+        model = mudslide.models.TullySimpleAvoidedCrossing()
+        outcomes = []
+        for nprocs in [1, 2]:
+            traj_gen = mudslide.TrajGenConst(-10.0, 10.0, "ground", seed=7)
+            batch = mudslide.BatchedTraj(model, traj_gen, mudslide.EvenSamplingTrajectory,
+                    samples=2, nprocs=nprocs, dt=20, bounds=[-5, 5], spawn_stack=[4, 3])
+            results = batch.compute()
+            outcomes.append((results.traces, results.outcomes))
+
+        serial, pool = outcomes
+        self.assertEqual(len(serial[0]), len(pool[0]))
+        self.assertTrue(np.allclose(serial[1], pool[1]))
+        # traces come back in the same order as in serial
+        for s, p in zip(serial[0], pool[0]):
+            self.assertEqual(len(s), len(p))
+            self.assertEqual(s.weight, p.weight)
+            self.assertTrue(np.array_equal(s[-1]["position"], p[-1]["position"]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ import unittest
 import sys
 
 from mudslide import poisson_prob_scale
+from mudslide.math import eigh2, quadratic_small_root, velocity_rescale
 import numpy as np
 
 class TestMath(unittest.TestCase):
@@ -17,5 +18,34 @@ class TestMath(unittest.TestCase):
         self.assertAlmostEqual(poisson_prob_scale(0.5), 0.7869386805747332, places=10)
         self.assertAlmostEqual(poisson_prob_scale(1.0), 0.6321205588285577, places=10)
 
+    def test_quadratic_small_root(self):
+        """Test stable quadratic root"""
+        self.assertAlmostEqual(quadratic_small_root(1.0, -3.0, 2.0), 1.0, places=12)
+        self.assertAlmostEqual(quadratic_small_root(1.0, 3.0, 2.0), -1.0, places=12)
+        self.assertAlmostEqual(quadratic_small_root(1e-3, 2.0, -1e-9), 5e-10, places=20)
+        self.assertEqual(quadratic_small_root(1.0, 0.0, 0.0), 0.0)
+
+    def test_velocity_rescale(self):
+        """Test velocity rescaling conserves energy and rejects frustrated hops"""
+        mass = np.array([2000.0, 1000.0])
+        v = np.array([1e-2, 5e-3])
+        d = np.array([1.0, 2.0])
+        kinetic = lambda vel: 0.5 * np.dot(mass * vel, vel)
+        for delV in [ 0.002, -0.03 ]:
+            dv = velocity_rescale(v, d, mass, delV)
+            self.assertAlmostEqual(kinetic(v + dv) + delV, kinetic(v), places=12)
+            self.assertAlmostEqual(abs(np.dot(dv, mass * np.array([-d[1], d[0]]))), 0.0, places=12)
+        self.assertIsNone(velocity_rescale(v, d, mass, 1.0))
+
+    def test_eigh2(self):
+        """Test closed form 2x2 Hermitian eigendecomposition"""
+        rng = np.random.default_rng(3)
+        A = rng.normal(size=(2,2)) + 1j * rng.normal(size=(2,2))
+        for H in [ A + A.conj().T, np.diag([0.3, -0.2]).astype(np.complex128), 0.5 * np.eye(2, dtype=np.complex128) ]:
+            energies, coeff = eigh2(H)
+            self.assertTrue(np.allclose(energies, np.linalg.eigh(H)[0]))
+            self.assertTrue(np.allclose(np.dot(H, coeff), coeff * energies))
+            self.assertTrue(np.allclose(np.dot(coeff.conj().T, coeff), np.eye(2)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit testing for single FSSH trajectories"""
+
+import unittest
+import queue
+
+import mudslide
+from mudslide.trajectory_sh import _pick_hop
+import numpy as np
+
+class TestElectronicDtype(unittest.TestCase):
+    """Test Suite for single precision electronic propagation"""
+    def setUp(self):
+        self.model = mudslide.models.TullySimpleAvoidedCrossing()
+        self.options = { "dt" : 5, "bounds" : [-5, 5], "seed_sequence" : 3 }
+
+    def run_traj(self, dtype, integration):
+        traj = mudslide.TrajectorySH(self.model, [-10.0], [15.0], "ground", electronic_dtype=dtype,
+                electronic_integration=integration, **self.options)
+        return traj.simulate()
+
+    def test_single_precision(self):
+        """complex64 density matrices stay single precision and track complex128 runs"""
+        for integration in [ "exp", "linear-rk4" ]:
+            with self.subTest(integration=integration):
+                single = self.run_traj(np.complex64, integration)
+                double = self.run_traj(np.complex128, integration)
+
+                self.assertTrue(all(s["density_matrix"].dtype == np.complex64 for s in single))
+                self.assertEqual(len(single), len(double))
+                self.assertEqual([ (h["time"], h["to"]) for h in single.hops ],
+                                 [ (h["time"], h["to"]) for h in double.hops ])
+                self.assertTrue(np.allclose(single[-1]["density_matrix"], double[-1]["density_matrix"], atol=1e-4))
+
+    def test_batched_single_precision(self):
+        """BatchedTrajectorySH honours electronic_dtype"""
+        batch = mudslide.BatchedTrajectorySH(self.model, [[-10.0]], [[15.0]], "ground",
+                electronic_dtype=np.complex64, dt=5, bounds=[-5, 5], seed_sequence=[ np.random.SeedSequence(3) ]).simulate()
+        double = self.run_traj(np.complex128, "exp")
+
+        self.assertTrue(all(s["density_matrix"].dtype == np.complex64 for s in batch.traces[0]))
+        self.assertTrue(np.allclose(batch.traces[0][-1]["density_matrix"], double[-1]["density_matrix"], atol=1e-4))
+
+class TestDuration(unittest.TestCase):
+    """Test Suite for trajectory stopping criteria"""
+    def test_scalar_box_bounds(self):
+        """A duration option with 0-d box bounds behaves like the bounds option"""
+        model = mudslide.models.TullySimpleAvoidedCrossing()
+        duration = { "found_box" : False, "box_bounds" : (np.array(-5.0), np.array(5.0)),
+                "max_steps" : 100000, "max_time" : 1e25 }
+        from_duration = mudslide.TrajectorySH(model, [-10.0], [15.0], "ground", dt=5, duration=duration,
+                seed_sequence=3).simulate()
+        from_bounds = mudslide.TrajectorySH(model, [-10.0], [15.0], "ground", dt=5, bounds=[-5, 5],
+                seed_sequence=3).simulate()
+
+        self.assertEqual(len(from_duration), len(from_bounds))
+        self.assertTrue(np.allclose(from_duration[-1]["position"], from_bounds[-1]["position"]))
+        # the caller's options are left as they were
+        self.assertEqual(duration["box_bounds"][0].shape, ())
+        self.assertFalse(duration["found_box"])
+
+class TestClone(unittest.TestCase):
+    """Test Suite for cloning trajectories"""
+    def test_clone_shares_queue(self):
+        """Clones share the queue with the parent but nothing else"""
+        model = mudslide.models.TullySimpleAvoidedCrossing()
+        q = queue.Queue()
+        traj = mudslide.TrajectorySH(model, [-10.0], [15.0], "ground", dt=5, queue=q)
+        clone = traj.clone()
+
+        self.assertIs(clone.queue, q)
+        self.assertIsNot(clone.position, traj.position)
+        self.assertIsNot(clone.rho, traj.rho)
+
+class TestRandom(unittest.TestCase):
+    """Test Suite for hopping random numbers"""
+    def test_buffered_random(self):
+        """Buffered random() yields the same numbers as drawing one at a time"""
+        model = mudslide.models.TullySimpleAvoidedCrossing()
+        traj = mudslide.TrajectorySH(model, [-10.0], [15.0], "ground", dt=5, seed_sequence=11)
+        reference = np.random.default_rng(np.random.SeedSequence(11))
+
+        # cross a couple of block refills
+        ndraws = 2 * mudslide.TrajectorySH.random_block_size + 3
+        buffered = [ traj.random() for i in range(ndraws) ]
+        scalar = [ reference.uniform() for i in range(ndraws) ]
+        self.assertEqual(buffered, scalar)
+
+class TestPickHop(unittest.TestCase):
+    """Test Suite for choosing the hop target"""
+    def test_matches_searchsorted(self):
+        """Short loop and searchsorted branches both find the first state past zeta"""
+        rng = np.random.default_rng(13)
+        for nstates in range(2, 13):
+            for trial in range(50):
+                with self.subTest(nstates=nstates, trial=trial):
+                    probs = rng.uniform(0.0, 0.5 / nstates, size=nstates)
+                    zeta = rng.uniform()
+                    acc_prob = np.cumsum(probs)
+                    expected = int(np.searchsorted(acc_prob, zeta, side="right"))
+
+                    hop_to, prob = _pick_hop(probs, zeta)
+                    if expected < nstates:
+                        self.assertEqual(hop_to, expected)
+                        self.assertAlmostEqual(prob, acc_prob[expected], places=12)
+                    else:
+                        self.assertEqual(hop_to, -1)
+                        self.assertAlmostEqual(prob, acc_prob[-1], places=12)
+
+    def test_no_hop(self):
+        """No hop when zeta exceeds the total probability"""
+        for nstates in [ 2, 8 ]:
+            with self.subTest(nstates=nstates):
+                probs = np.full(nstates, 0.01)
+                self.assertEqual(_pick_hop(probs, 0.5)[0], -1)
+                self.assertEqual(_pick_hop(np.zeros(nstates), 0.0)[0], -1)
+
+if __name__ == '__main__':
+    unittest.main()